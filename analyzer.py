@@ -1,6 +1,8 @@
+import asyncio
 import logging
-from typing import List, Set, Dict, Any, Optional
-from api_client import APIClient
+from collections import Counter
+from typing import Iterator, List, Set, Dict, Any, Optional
+from api_client import APIClient, AsyncAPIClient
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -10,17 +12,23 @@ class AddressAnalyzer:
     Analyzes Bitcoin addresses, including transaction history, balance, and clustering of addresses.
     """
     
-    def __init__(self, api_client: APIClient):
+    def __init__(self, api_client: APIClient, max_workers: int = 8):
         """
         Initialize the AddressAnalyzer with an APIClient.
         
         Parameters:
         - api_client (APIClient): The client used to interact with the Bitcoin API.
+        - max_workers (int): Number of threads reading the response cache during concurrent fetches (default is 8).
         """
         self.api_client = api_client
-        self.explored_transactions: Set[str] = set()
+        self.max_workers = max_workers
+        # Explored txids are stored as their 32 raw bytes, about half the memory of the hex strings
+        self.explored_transactions: Set[bytes] = set()
         self.explored_addresses: Set[str] = set()
+        self._addr_info_cache: Dict[str, Dict[str, Any]] = {}
         self.max_depth = 5
+        self.max_cluster_nodes = 50_000
+        self.max_frontier_per_depth = 2_000
 
     def analyze(self, address: str) -> Optional[int]:
         """
@@ -29,24 +37,36 @@ class AddressAnalyzer:
         Parameters:
         - address (str): The Bitcoin address to analyze.
         
+        Returns:
+        - Optional[int]: The balance of the address in satoshis, or None if an error occurred.
+        """
+        return self._report_address(address, self.api_client.get_address_info(address))
+
+    def _report_address(self, address: str, info: Optional[Dict[str, Any]]) -> Optional[int]:
+        """
+        Log the balance and transaction count of a Bitcoin address from its information.
+        
+        Parameters:
+        - address (str): The Bitcoin address.
+        - info (Optional[Dict[str, Any]]): The address information, or None if it could not be retrieved.
+        
         Returns:
         - Optional[int]: The balance of the address in satoshis, or None if an error occurred.
         """
         try:
-            info = self.api_client.get_address_info(address)
             if info is None:
-                logger.error(f"Unable to retrieve information for address: {address}")
+                logger.error("Unable to retrieve information for address: %s", address)
                 return None
 
-            logger.info(f"Analyzing address: {address}")
+            logger.info("Analyzing address: %s", address)
             balance = self._calculate_balance(info)
             tx_count = info.get('chain_stats', {}).get('tx_count', 0)
 
-            logger.info(f"Current balance: {balance} satoshi ({balance / 1e8:.8f} BTC)")
-            logger.info(f"Total number of transactions: {tx_count}")
+            logger.info("Current balance: %s satoshi (%.8f BTC)", balance, balance / 1e8)
+            logger.info("Total number of transactions: %d", tx_count)
             return balance
         except (KeyError, TypeError) as e:
-            logger.error(f"Error analyzing address {address}: {e}")
+            logger.error("Error analyzing address %s: %s", address, e)
             return None
 
     def _calculate_balance(self, info: Dict[str, Any]) -> int:
@@ -77,11 +97,11 @@ class AddressAnalyzer:
         try:
             transactions = self.api_client.get_transactions(address)
             if transactions is None:
-                logger.error(f"Unable to retrieve transactions for address: {address}")
+                logger.error("Unable to retrieve transactions for address: %s", address)
                 return []
             return transactions
         except (KeyError, TypeError) as e:
-            logger.error(f"Error retrieving transactions for address {address}: {e}")
+            logger.error("Error retrieving transactions for address %s: %s", address, e)
             return []
 
     def analyze_wallet_cluster(self, addresses: List[str], depth: int = 2) -> None:
@@ -97,49 +117,135 @@ class AddressAnalyzer:
             cluster = set(addresses)
             self.explored_transactions.clear()
             self.explored_addresses.clear()
-            for address in addresses:
-                self._explore_cluster(address, cluster, depth)
+            self._addr_info_cache.clear()
+            asyncio.run(self._analyze_wallet_cluster_async(addresses, cluster, depth))
             logger.info("Cluster of addresses connected to the provided addresses:")
             for addr in cluster:
-                balance = self.analyze(addr)
+                balance = self._report_address(addr, self._addr_info_cache.get(addr))
                 if balance is not None:
-                    logger.info(f"Address: {addr}, Balance: {balance / 1e8:.8f} BTC")
+                    logger.info("Address: %s, Balance: %.8f BTC", addr, balance / 1e8)
         except (KeyError, TypeError) as e:
-            logger.error(f"Error analyzing wallet cluster for addresses {addresses}: {e}")
+            logger.error("Error analyzing wallet cluster for addresses %s: %s", addresses, e)
 
-    def _explore_cluster(self, address: str, cluster: Set[str], depth: int) -> None:
+    async def _analyze_wallet_cluster_async(self, addresses: List[str], cluster: Set[str], depth: int) -> None:
         """
-        Recursively explore the cluster of addresses connected to a given address.
+        Explore the cluster and make sure the information of every member address is cached.
         
         Parameters:
-        - address (str): The Bitcoin address to explore.
+        - addresses (List[str]): The Bitcoin addresses to start the exploration from.
         - cluster (Set[str]): The set of addresses that are part of the cluster.
-        - depth (int): The remaining depth to explore.
+        - depth (int): The number of levels to explore.
         """
-        if depth <= 0 or address in self.explored_addresses:
-            return
-        self.explored_addresses.add(address)
-        cluster.add(address)
-        try:
-            transactions = self.get_transactions(address)[:100]
-            for tx in transactions:
-                if tx['txid'] in self.explored_transactions:
+        async with AsyncAPIClient.from_client(self.api_client, max_workers=self.max_workers) as client:
+            await self._explore_cluster_async(client, addresses, cluster, depth)
+            missing = [address for address in cluster if address not in self._addr_info_cache]
+            infos = await asyncio.gather(*(client.get_address_info(address) for address in missing))
+            for address, info in zip(missing, infos):
+                if info is not None:
+                    self._addr_info_cache[address] = info
+
+    async def _explore_cluster_async(self, client: AsyncAPIClient, addresses: List[str], cluster: Set[str],
+                                     depth: int) -> None:
+        """
+        Explore the cluster of addresses connected to the given addresses, breadth-first.
+
+        Each depth level is fetched as one concurrent batch: the information and
+        transactions of every frontier address first, then the details of every
+        transaction not explored yet. The last level only fetches address information,
+        which is kept for the cluster report.
+        
+        Parameters:
+        - client (AsyncAPIClient): The client used to fetch the data.
+        - addresses (List[str]): The Bitcoin addresses to start the exploration from.
+        - cluster (Set[str]): The set of addresses that are part of the cluster.
+        - depth (int): The number of levels to explore.
+        """
+        # Addresses are checked against the cluster when they are queued, so every
+        # frontier holds only addresses that have not been explored yet
+        frontier = list(dict.fromkeys(addresses))
+        while frontier and depth > 0:
+            logger.info("Exploring %d address(es), %d level(s) left", len(frontier), depth)
+            self.explored_addresses.update(frontier)
+            cluster.update(frontier)
+
+            # The transactions of the last level would only lead to addresses that are never explored
+            last_level = depth == 1
+            infos, tx_lists = await asyncio.gather(
+                asyncio.gather(*(client.get_address_info(address) for address in frontier)),
+                asyncio.gather(*(client.get_transactions(address) for address in frontier if not last_level)),
+            )
+            for address, info in zip(frontier, infos):
+                if info is not None:
+                    self._addr_info_cache[address] = info
+            if last_level:
+                break
+
+            new_txids: List[str] = []
+            for address, transactions in zip(frontier, tx_lists):
+                if transactions is None:
+                    logger.error("Unable to retrieve transactions for address: %s", address)
                     continue
-                self.explored_transactions.add(tx['txid'])
+                for tx in transactions[:100]:
+                    txid_bytes = bytes.fromhex(tx['txid'])
+                    if txid_bytes not in self.explored_transactions:
+                        self.explored_transactions.add(txid_bytes)
+                        new_txids.append(tx['txid'])
 
-                tx_info = self.api_client.get_transaction_info(tx['txid'])
+            logger.info("Fetching %d new transaction(s) of the frontier", len(new_txids))
+            tx_infos = await asyncio.gather(*(client.get_transaction_info(txid) for txid in new_txids))
+            queued: Counter = Counter()
+            for txid, tx_info in zip(new_txids, tx_infos):
                 if tx_info is None:
-                    logger.error(f"Unable to retrieve transaction info for txid: {tx['txid']}")
+                    logger.error("Unable to retrieve transaction info for txid: %s", txid)
                     continue
+                try:
+                    for linked_address in self._linked_addresses(tx_info):
+                        if linked_address not in cluster:
+                            queued[linked_address] += 1
+                except (KeyError, TypeError) as e:
+                    logger.error("Error exploring cluster through transaction %s: %s", txid, e)
 
-                for vin in tx_info.get('vin', []):
-                    prevout_address = vin.get('prevout', {}).get('scriptpubkey_address')
-                    if prevout_address and prevout_address not in cluster:
-                        self._explore_cluster(prevout_address, cluster, depth - 1)
+            frontier = self._cap_frontier(queued, len(cluster))
+            depth -= 1
 
-                for vout in tx_info.get('vout', []):
-                    vout_address = vout.get('scriptpubkey_address')
-                    if vout_address and vout_address not in cluster:
-                        self._explore_cluster(vout_address, cluster, depth - 1)
-        except (KeyError, TypeError) as e:
-            logger.error(f"Error exploring cluster for address {address}: {e}")
+    def _cap_frontier(self, queued: Counter, cluster_size: int) -> List[str]:
+        """
+        Bound the next frontier by the per-depth and total cluster size limits.
+
+        When the frontier is too large, the addresses linked to the most transactions
+        of the current level are kept, ties broken by discovery order, so truncated
+        explorations are reproducible.
+        
+        Parameters:
+        - queued (Counter): The candidate addresses with the number of transactions linking to them.
+        - cluster_size (int): The current number of addresses in the cluster.
+        
+        Returns:
+        - List[str]: The addresses to explore next.
+        """
+        limit = max(0, min(self.max_frontier_per_depth, self.max_cluster_nodes - cluster_size))
+        if len(queued) <= limit:
+            return list(queued)
+        logger.warning("Truncating cluster frontier from %d to %d addresses (cluster size %d)",
+                       len(queued), limit, cluster_size)
+        return [address for address, _ in queued.most_common(limit)]
+
+    @staticmethod
+    def _linked_addresses(tx_info: Dict[str, Any]) -> Iterator[str]:
+        """
+        Yield the addresses spending into and receiving from a transaction.
+        
+        Parameters:
+        - tx_info (Dict[str, Any]): The transaction information.
+        
+        Returns:
+        - Iterator[str]: The input (prevout) addresses followed by the output addresses.
+        """
+        for vin in tx_info.get('vin', []):
+            prevout_address = (vin.get('prevout') or {}).get('scriptpubkey_address')
+            if prevout_address:
+                yield prevout_address
+        for vout in tx_info.get('vout', []):
+            vout_address = vout.get('scriptpubkey_address')
+            if vout_address:
+                yield vout_address
@@ -1,82 +1,434 @@
+import asyncio
 import requests
-import json
+import orjson
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import RequestException
-import diskcache as dc
+import httpx
+from cache import LRUCache, ResponseCache, is_confirmed, is_historical_date
+from rate_limiter import AIMDLimiter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class APIClient:
-    def __init__(self, max_retries=3, retry_delay=3, cache_dir='cache'):
-        self.base_url = "https://blockstream.info/api"
-        self.coingecko_url = "https://api.coingecko.com/api/v3"
+# Price lookups arriving within this window (in seconds) are dispatched together
+PRICE_BATCH_WINDOW = 0.0005
+
+# Number of confirmed transactions and output spends memoized by txid
+TX_CACHE_SIZE = 4096
+
+# Number of blocks memoized by hash
+BLOCK_CACHE_SIZE = 512
+
+# Output script types that can never be spent, so their spending status is never fetched
+UNSPENDABLE_SCRIPT_TYPES = frozenset(('op_return', 'nulldata'))
+
+def _is_client_error(status):
+    # 4xx responses other than 429 will not change on a retry
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+class _Endpoints:
+    """
+    URL builders for the API endpoints, bound once per base URL so building a request
+    URL is a single string concatenation or formatting call.
+    """
+
+    def _set_endpoints(self, base_url, coingecko_url):
+        self.base_url = base_url
+        self.coingecko_url = coingecko_url
+        self._address_url = f"{base_url}/address/".__add__
+        self._address_txs_url = f"{base_url}/address/%s/txs".__mod__
+        self._tx_url = f"{base_url}/tx/".__add__
+        self._outspend_url = f"{base_url}/tx/%s/outspend/%s".__mod__
+        self._outspends_url = f"{base_url}/tx/%s/outspends".__mod__
+        self._block_url = f"{base_url}/block/".__add__
+        self._price_url = f"{coingecko_url}/coins/bitcoin/history?date=%s".__mod__
+
+
+class APIClient(_Endpoints):
+    def __init__(self, max_retries=3, retry_delay=3, cache_dir='cache', timeout=10.0, cache_daemon=None):
+        self._set_endpoints("https://blockstream.info/api", "https://api.coingecko.com/api/v3")
         self.max_retries = max_retries
         self.retry_delay = retry_delay
-        self.cache = dc.Cache(cache_dir)
+        if cache_daemon:
+            # The daemon owns the on-disk cache, so only keep responses in memory here
+            logger.info("Routing API requests through the cache daemon at %s", cache_daemon)
+            self._set_endpoints(f"{cache_daemon}/blockstream", f"{cache_daemon}/coingecko")
+            self.cache = ResponseCache(None)
+        else:
+            self.cache = ResponseCache(cache_dir)
+        self.timeout = timeout
+        # Prices of past days never change, so they are memoized by date
+        self.price_cache = {}
+        # Confirmed transactions and spends never change either; memoizing them by txid skips
+        # the URL lookup and expiry checks of the response cache on diamond-shaped flows
+        self.tx_cache = LRUCache(TX_CACHE_SIZE)
+        # The contents of a block hash never change
+        self.block_cache = LRUCache(BLOCK_CACHE_SIZE)
+        # Reuse connections across requests instead of paying a TCP+TLS handshake per call
+        self.session = requests.Session()
+        # Requests in progress by URL, so threads asking for the same URL (as the cache daemon's do) share one fetch
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    def close(self):
+        self.session.close()
+        self.cache.close()
 
     def _make_request(self, url):
+        return self._make_request_with_status(url)[0]
+
+    def _make_request_with_status(self, url):
+        # Returns the decoded response with the upstream HTTP status, or None as the status when no response was received
         # Check cache first
-        if url in self.cache:
-            logger.info(f"Returning cached response for URL: {url}")
-            return self.cache[url]
+        cached = self.cache.get(url)
+        if cached is not None:
+            logger.debug("Returning cached response for URL: %s", url)
+            return cached, 200
 
-        logger.info(f"Making request to URL: {url}")
+        with self._inflight_lock:
+            inflight = self._inflight.get(url)
+            if inflight is None:
+                inflight = self._inflight[url] = [threading.Event(), (None, None)]
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            logger.debug("Joining in-flight request for URL: %s", url)
+            inflight[0].wait()
+            return inflight[1]
+        try:
+            inflight[1] = self._fetch(url)
+            return inflight[1]
+        finally:
+            with self._inflight_lock:
+                del self._inflight[url]
+            inflight[0].set()
+
+    def _fetch(self, url):
+        logger.info("Making request to URL: %s", url)
         for attempt in range(self.max_retries):
             try:
-                response = requests.get(url)
+                response = self.session.get(url, timeout=self.timeout)
                 response.raise_for_status()  # Raise an exception for bad status codes
-                logger.info(f"Received response from {url}: {response.status_code}")
-                data = response.json()
-                self.cache[url] = data  # Store response in cache
-                return data
+                logger.info("Received response from %s: %s", url, response.status_code)
+                data = orjson.loads(response.content)
+                self.cache.set(url, data, response.content)  # Store response in cache
+                return data, response.status_code
             except RequestException as e:
-                logger.error(f"Attempt {attempt + 1} failed. Error making request to {url}: {e}")
+                status = e.response.status_code if e.response is not None else None
+                if _is_client_error(status):
+                    logger.error("Error making request to %s: %s", url, e)
+                    return None, status
+                logger.error("Attempt %d failed. Error making request to %s: %s", attempt + 1, url, e)
                 if attempt + 1 < self.max_retries:
-                    logger.info(f"Retrying in {self.retry_delay} seconds...")
+                    logger.info("Retrying in %s seconds...", self.retry_delay)
                     time.sleep(self.retry_delay)
                 else:
                     logger.error("Max retries reached. Giving up.")
-                    return None
-            except json.JSONDecodeError as e:
-                logger.error(f"Error decoding JSON from {url}: {e}")
-                logger.error(f"Response content: {response.text}")
-                return None
+                    return None, status
+            except orjson.JSONDecodeError as e:
+                logger.error("Error decoding JSON from %s: %s", url, e)
+                logger.error("Response content: %s", response.text)
+                return None, response.status_code
 
     def get_address_info(self, address):
-        url = f"{self.base_url}/address/{address}"
-        logger.info(f"Fetching address info for: {address}")
+        url = self._address_url(address)
+        logger.debug("Fetching address info for: %s", address)
         return self._make_request(url)
 
     def get_transactions(self, address):
-        url = f"{self.base_url}/address/{address}/txs"
-        logger.info(f"Fetching transactions for address: {address}")
+        url = self._address_txs_url(address)
+        logger.debug("Fetching transactions for address: %s", address)
         return self._make_request(url)
 
     def get_transaction_info(self, txid):
-        url = f"{self.base_url}/tx/{txid}"
-        logger.info(f"Fetching transaction info for TXID: {txid}")
-        return self._make_request(url)
+        data = self.tx_cache.get(txid)
+        if data is not None:
+            return data
+        url = self._tx_url(txid)
+        logger.debug("Fetching transaction info for TXID: %s", txid)
+        data = self._make_request(url)
+        if is_confirmed(data):
+            self.tx_cache[txid] = data
+        return data
 
     def get_spending_tx(self, txid, vout):
-        url = f"{self.base_url}/tx/{txid}/outspend/{vout}"
-        logger.info(f"Fetching spending transaction for TXID: {txid}, VOUT: {vout}")
+        data = self.tx_cache.get((txid, vout))
+        if data is not None:
+            return data
+        url = self._outspend_url((txid, vout))
+        logger.debug("Fetching spending transaction for TXID: %s, VOUT: %s", txid, vout)
+        data = self._make_request(url)
+        if data and data.get('spent') and is_confirmed(data):
+            self.tx_cache[(txid, vout)] = data
+        return data
+
+    def get_spending_txs_bulk(self, txid):
+        # One request for the spending status of every output, indexed by output position
+        url = self._outspends_url(txid)
+        logger.debug("Fetching spending transactions for all outputs of TXID: %s", txid)
         return self._make_request(url)
 
+    def get_all_outspends(self, txid, vouts):
+        # Falls back to one request per spendable output if the bulk endpoint is unavailable
+        outspends = self.get_spending_txs_bulk(txid)
+        if outspends is None:
+            logger.warning("Bulk outspends unavailable for TXID: %s, fetching %d outputs one by one", txid, len(vouts))
+            outspends = [None if vout.get('scriptpubkey_type') in UNSPENDABLE_SCRIPT_TYPES else self.get_spending_tx(txid, n)
+                         for n, vout in enumerate(vouts)]
+        return outspends
+
     def get_block_info(self, block_hash):
-        url = f"{self.base_url}/block/{block_hash}"
-        logger.info(f"Fetching block info for block hash: {block_hash}")
-        return self._make_request(url)
+        data = self.block_cache.get(block_hash)
+        if data is not None:
+            return data
+        url = self._block_url(block_hash)
+        logger.debug("Fetching block info for block hash: %s", block_hash)
+        data = self._make_request(url)
+        if data:
+            self.block_cache[block_hash] = data
+        return data
 
     def get_bitcoin_price(self, date):
-        url = f"{self.coingecko_url}/coins/bitcoin/history?date={date}"
-        logger.info(f"Fetching Bitcoin price for date: {date}")
+        price = self.price_cache.get(date)
+        if price is not None:
+            return price
+        url = self._price_url(date)
+        logger.debug("Fetching Bitcoin price for date: %s", date)
         data = self._make_request(url)
         if data and 'market_data' in data:
             price = data['market_data']['current_price']['usd']
-            logger.info(f"Bitcoin price on {date}: {price} USD")
+            logger.info("Bitcoin price on %s: %s USD", date, price)
+            if is_historical_date(date):
+                self.price_cache[date] = price
+            return price
+        logger.warning("Market data not found in response for date: %s", date)
+        return None
+
+
+class AsyncAPIClient(_Endpoints):
+    """
+    Asynchronous counterpart of APIClient, used to fan out many requests concurrently.
+
+    Shares the on-disk response cache with APIClient, so either client can serve
+    responses fetched by the other. Cache reads that miss memory run on a small
+    thread pool so SQLite I/O does not block the event loop. Use it as an async
+    context manager so the connection pool and threads are released when the
+    analysis is done.
+    """
+
+    def __init__(self, max_retries=3, retry_delay=3, cache=None, cache_dir='cache', timeout=10.0,
+                 max_connections=32, min_concurrency=1, max_concurrency=16, requests_per_minute=None,
+                 max_workers=8, price_cache=None, tx_cache=None, block_cache=None):
+        self._set_endpoints("https://blockstream.info/api", "https://api.coingecko.com/api/v3")
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.cache = cache if cache is not None else ResponseCache(cache_dir)
+        # HTTP/2 multiplexes concurrent requests over one pooled TLS connection per host
+        self._client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+        self.limiter = AIMDLimiter(min_concurrency=min_concurrency, max_concurrency=max_concurrency,
+                                   requests_per_minute=requests_per_minute)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cache-reader")
+        self._inflight = {}
+        self.price_cache = price_cache if price_cache is not None else {}
+        self.tx_cache = tx_cache if tx_cache is not None else LRUCache(TX_CACHE_SIZE)
+        self.block_cache = block_cache if block_cache is not None else LRUCache(BLOCK_CACHE_SIZE)
+        self._price_batch = None
+        self._price_tasks = set()
+
+    @classmethod
+    def from_client(cls, client, **kwargs):
+        """Create an async client sharing the endpoints, retry settings and cache of a synchronous APIClient."""
+        async_client = cls(max_retries=client.max_retries, retry_delay=client.retry_delay, cache=client.cache,
+                           timeout=client.timeout, price_cache=client.price_cache, tx_cache=client.tx_cache,
+                           block_cache=client.block_cache, **kwargs)
+        async_client._set_endpoints(client.base_url, client.coingecko_url)
+        return async_client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+        self._executor.shutdown(wait=False)
+
+    async def _make_request(self, url):
+        # Check the in-memory cache first
+        cached = self.cache.peek(url)
+        if cached is not None:
+            logger.debug("Returning cached response for URL: %s", url)
+            return cached
+
+        # Concurrent callers for the same URL share a single disk lookup and fetch
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._load(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        else:
+            logger.debug("Joining in-flight request for URL: %s", url)
+        return await asyncio.shield(task)
+
+    async def _load(self, url):
+        # Read from disk off the event loop, fetching only when the response is not cached
+        cached = await asyncio.get_running_loop().run_in_executor(self._executor, self.cache.get, url)
+        if cached is not None:
+            logger.debug("Returning cached response for URL: %s", url)
+            return cached
+        return await self._fetch(url)
+
+    async def _fetch(self, url):
+        logger.info("Making request to URL: %s", url)
+        for attempt in range(self.max_retries):
+            try:
+                response = await self._limited_get(url)
+                response.raise_for_status()
+                logger.info("Received response from %s: %s", url, response.status_code)
+                data = orjson.loads(response.content)
+                self.cache.set(url, data, response.content)
+                return data
+            except httpx.HTTPError as e:
+                if isinstance(e, httpx.HTTPStatusError) and _is_client_error(e.response.status_code):
+                    logger.error("Error making request to %s: %s", url, e)
+                    return None
+                logger.error("Attempt %d failed. Error making request to %s: %s", attempt + 1, url, e)
+                if attempt + 1 < self.max_retries:
+                    logger.info("Retrying in %s seconds...", self.retry_delay)
+                    await asyncio.sleep(self.retry_delay)
+                else:
+                    logger.error("Max retries reached. Giving up.")
+                    return None
+            except orjson.JSONDecodeError as e:
+                logger.error("Error decoding JSON from %s: %s", url, e)
+                logger.error("Response content: %s", response.text)
+                return None
+
+    async def _limited_get(self, url):
+        # Hold a concurrency slot for the duration of the request and feed its outcome back to the limiter
+        await self.limiter.acquire()
+        start = time.monotonic()
+        status, headers = None, None
+        try:
+            response = await self._client.get(url)
+            status, headers = response.status_code, response.headers
+            return response
+        finally:
+            await self.limiter.release(time.monotonic() - start, status, headers)
+
+    async def get_address_info(self, address):
+        url = self._address_url(address)
+        logger.debug("Fetching address info for: %s", address)
+        return await self._make_request(url)
+
+    async def get_transactions(self, address):
+        url = self._address_txs_url(address)
+        logger.debug("Fetching transactions for address: %s", address)
+        return await self._make_request(url)
+
+    async def get_transaction_info(self, txid):
+        data = self.tx_cache.get(txid)
+        if data is not None:
+            return data
+        url = self._tx_url(txid)
+        logger.debug("Fetching transaction info for TXID: %s", txid)
+        data = await self._make_request(url)
+        if is_confirmed(data):
+            self.tx_cache[txid] = data
+        return data
+
+    async def get_spending_tx(self, txid, vout):
+        data = self.tx_cache.get((txid, vout))
+        if data is not None:
+            return data
+        url = self._outspend_url((txid, vout))
+        logger.debug("Fetching spending transaction for TXID: %s, VOUT: %s", txid, vout)
+        data = await self._make_request(url)
+        if data and data.get('spent') and is_confirmed(data):
+            self.tx_cache[(txid, vout)] = data
+        return data
+
+    async def get_spending_txs_bulk(self, txid):
+        url = self._outspends_url(txid)
+        logger.debug("Fetching spending transactions for all outputs of TXID: %s", txid)
+        return await self._make_request(url)
+
+    async def get_all_outspends(self, txid, vouts):
+        outspends = await self.get_spending_txs_bulk(txid)
+        if outspends is None:
+            outspends = await self.get_outspends_by_output(txid, vouts)
+        return outspends
+
+    async def get_outspends_by_output(self, txid, vouts):
+        logger.warning("Bulk outspends unavailable for TXID: %s, fetching %d outputs one by one", txid, len(vouts))
+        return await asyncio.gather(*(self._get_spendable_spending_tx(txid, n, vout) for n, vout in enumerate(vouts)))
+
+    async def _get_spendable_spending_tx(self, txid, n, vout):
+        if vout.get('scriptpubkey_type') in UNSPENDABLE_SCRIPT_TYPES:
+            return None
+        return await self.get_spending_tx(txid, n)
+
+    async def get_block_info(self, block_hash):
+        data = self.block_cache.get(block_hash)
+        if data is not None:
+            return data
+        url = self._block_url(block_hash)
+        logger.debug("Fetching block info for block hash: %s", block_hash)
+        data = await self._make_request(url)
+        if data:
+            self.block_cache[block_hash] = data
+        return data
+
+    async def get_bitcoin_price(self, date):
+        # Lookups for the same date are coalesced, and dates requested within a short
+        # window are fetched together as one concurrent batch
+        price = self.price_cache.get(date)
+        if price is not None:
+            return price
+        loop = asyncio.get_running_loop()
+        if self._price_batch is None:
+            self._price_batch = {}
+            loop.call_later(PRICE_BATCH_WINDOW, self._dispatch_price_batch)
+        future = self._price_batch.get(date)
+        if future is None:
+            future = self._price_batch[date] = loop.create_future()
+        return await asyncio.shield(future)
+
+    def _dispatch_price_batch(self):
+        batch, self._price_batch = self._price_batch, None
+        logger.info("Fetching Bitcoin prices for %d date(s)", len(batch))
+        task = asyncio.ensure_future(self._fetch_price_batch(batch))
+        self._price_tasks.add(task)
+        task.add_done_callback(self._price_tasks.discard)
+
+    async def _fetch_price_batch(self, batch):
+        prices = await asyncio.gather(*(self._fetch_price(date) for date in batch), return_exceptions=True)
+        for future, price in zip(batch.values(), prices):
+            if isinstance(price, BaseException):
+                future.set_exception(price)
+            else:
+                future.set_result(price)
+
+    async def _fetch_price(self, date):
+        url = self._price_url(date)
+        logger.debug("Fetching Bitcoin price for date: %s", date)
+        data = await self._make_request(url)
+        if data and 'market_data' in data:
+            price = data['market_data']['current_price']['usd']
+            logger.info("Bitcoin price on %s: %s USD", date, price)
+            if is_historical_date(date):
+                self.price_cache[date] = price
             return price
-        logger.warning(f"Market data not found in response for date: {date}")
+        logger.warning("Market data not found in response for date: %s", date)
         return None
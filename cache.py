@@ -0,0 +1,330 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import diskcache as dc
+import orjson
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite pragmas applied to the diskcache database (diskcache maps `sqlite_<name>` settings to PRAGMAs)
+SQLITE_SETTINGS = {
+    'sqlite_journal_mode': 'wal',
+    'sqlite_synchronous': 1,  # NORMAL
+    'sqlite_temp_store': 2,  # MEMORY
+    'sqlite_mmap_size': 2 ** 28,
+}
+
+_STOP = object()
+_MISSING = object()
+
+def is_historical_date(date: str) -> bool:
+    """
+    Check whether a CoinGecko `dd-mm-yyyy` date lies before the current UTC day.
+
+    The price of a past day is final, while today's price still changes.
+
+    Parameters:
+    - date (str): The date in `dd-mm-yyyy` format.
+
+    Returns:
+    - bool: True if the date is valid and earlier than today (UTC).
+    """
+    try:
+        day = datetime.strptime(date, "%d-%m-%Y").date()
+    except ValueError:
+        return False
+    return day < datetime.now(timezone.utc).date()
+
+def is_confirmed(data: Any) -> bool:
+    """
+    Check whether an Esplora transaction or spend response is confirmed.
+
+    Unconfirmed transactions and spends can still be replaced, so they are neither
+    memoized nor cached without an expiry.
+
+    Parameters:
+    - data (Any): The decoded response.
+
+    Returns:
+    - bool: True if the response is a dict whose status is confirmed.
+    """
+    return isinstance(data, dict) and bool(data.get('status', {}).get('confirmed', False))
+
+def _price_history_ttl(url: str, data: Any) -> Optional[float]:
+    date = parse_qs(urlsplit(url).query).get('date', [''])[0]
+    return None if is_historical_date(date) else 3600
+
+def _outspend_ttl(url: str, data: Any) -> Optional[float]:
+    # Covers both /outspend/<n> (one spend) and /outspends (a list with one spend per output)
+    spends = data if isinstance(data, list) else [data]
+    return None if all(isinstance(s, dict) and s.get('spent') and is_confirmed(s) for s in spends) else 60
+
+def _tx_ttl(url: str, data: Any) -> Optional[float]:
+    return None if is_confirmed(data) else 60
+
+# Time-to-live, in seconds, of cached responses by URL pattern; the first pattern found in the
+# URL applies, and callables compute the TTL from the URL and response. Confirmed transactions
+# and spends, blocks and prices of past days never change, so they are kept forever, while
+# unconfirmed transactions, unspent outputs, address state and the current day's price are
+# revalidated.
+CACHE_TTL = {
+    "/outspend": _outspend_ttl,
+    "/tx/": _tx_ttl,
+    "/block/": None,
+    "/address/": 60,
+    "/coins/bitcoin/history": _price_history_ttl,
+}
+
+def cache_ttl(url: str, data: Any = None) -> Optional[float]:
+    """
+    Get the time-to-live of a cached response.
+
+    Parameters:
+    - url (str): The request URL.
+    - data (Any): The decoded response.
+
+    Returns:
+    - Optional[float]: The time-to-live in seconds, or None if the response never expires.
+    """
+    for pattern, ttl in CACHE_TTL.items():
+        if pattern in url:
+            return ttl(url, data) if callable(ttl) else ttl
+    return None
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded in-memory cache evicting the least recently used entry.
+
+    Hits and misses of `get` are counted so the size can be tuned.
+    """
+
+    def __init__(self, maxsize: int = 8192):
+        """
+        Initialize an empty cache.
+
+        Parameters:
+        - maxsize (int): Maximum number of entries kept in memory.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._data[key]
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses with batched, write-behind persistence.
+
+    Writes are queued and persisted by a background thread that groups up to
+    `batch_size` rows, or whatever arrives within `flush_interval` seconds, into a
+    single transaction. Responses are stored as raw JSON bytes, which SQLite keeps as
+    BLOBs without pickling. Queued responses stay readable until they are on disk, and
+    recently used responses are served decoded from an in-memory LRU. Responses expire
+    after the time-to-live given by `CACHE_TTL` for their URL and content. Without a directory
+    the cache is memory-only.
+    """
+
+    def __init__(self, directory: Optional[str] = 'cache', batch_size: int = 256, flush_interval: float = 0.05,
+                 memory_size: int = 8192):
+        """
+        Open the cache and start the background writer.
+
+        Parameters:
+        - directory (Optional[str]): Directory of the diskcache database, or None for a memory-only cache.
+        - batch_size (int): Maximum number of responses written per transaction.
+        - flush_interval (float): Maximum time, in seconds, a queued response waits for its batch to fill.
+        - memory_size (int): Number of decoded responses kept in the in-memory LRU.
+        """
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.memory = LRUCache(memory_size)
+        self._pending: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._disk: Optional[dc.Cache] = None
+        self._writer: Optional[threading.Thread] = None
+        if directory is not None:
+            self._disk = dc.Cache(directory, **SQLITE_SETTINGS)
+            self._writer = threading.Thread(target=self._write_loop, name="response-cache-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def __contains__(self, url: str) -> bool:
+        return self.get(url, _MISSING) is not _MISSING
+
+    def __getitem__(self, url: str) -> Any:
+        data = self.get(url, _MISSING)
+        if data is _MISSING:
+            raise KeyError(url)
+        return data
+
+    def get(self, url: str, default: Any = None) -> Any:
+        """
+        Look up a cached response with at most one database query.
+
+        diskcache keeps one SQLite connection per thread, so lookups from worker
+        threads run as concurrent readers under WAL.
+
+        Parameters:
+        - url (str): The request URL.
+        - default (Any): Value returned when the response is not cached.
+
+        Returns:
+        - Any: The cached response, or `default`.
+        """
+        data = self.peek(url, _MISSING)
+        if data is not _MISSING:
+            return data
+        if self._disk is None:
+            return default
+        # diskcache treats expired rows as missing
+        data = self._disk.get(url, _MISSING, retry=True)
+        if data is _MISSING:
+            return default
+        if not isinstance(data, bytes):
+            # Rows pickled by earlier versions were stored without an expiry: keep those that
+            # never expire, re-storing them as JSON, and refetch the rest
+            if cache_ttl(url, data) is not None:
+                return default
+            self.set(url, data)
+            return data
+        data = orjson.loads(data)
+        self._remember(url, data)
+        return data
+
+    def peek(self, url: str, default: Any = None) -> Any:
+        """
+        Look up a cached response in memory only, without touching the database.
+
+        Parameters:
+        - url (str): The request URL.
+        - default (Any): Value returned when the response is not in memory.
+
+        Returns:
+        - Any: The cached response, or `default`.
+        """
+        entry = self.memory.get(url, _MISSING)
+        if entry is not _MISSING:
+            expires_at, data = entry
+            if expires_at is None or time.time() < expires_at:
+                return data
+        with self._lock:
+            return self._pending.get(url, default)
+
+    def __setitem__(self, url: str, data: Any) -> None:
+        self.set(url, data)
+
+    def set(self, url: str, data: Any, payload: Optional[bytes] = None) -> None:
+        """
+        Cache a decoded response and queue it for writing to disk.
+
+        Parameters:
+        - url (str): The request URL.
+        - data (Any): The decoded response.
+        - payload (Optional[bytes]): The raw JSON body, if available, to store without re-encoding `data`.
+        """
+        self._remember(url, data)
+        if self._disk is None:
+            return
+        with self._lock:
+            self._pending[url] = data
+        self._queue.put_nowait((url, data, payload))
+
+    def _remember(self, url: str, data: Any) -> None:
+        ttl = cache_ttl(url, data)
+        self.memory[url] = (None if ttl is None else time.time() + ttl, data)
+
+    def flush(self) -> None:
+        """
+        Block until every queued response has been written to disk.
+        """
+        self._queue.join()
+
+    def close(self) -> None:
+        """
+        Flush queued responses, stop the background writer and close the database.
+        """
+        if self._writer is None or not self._writer.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._disk.close()
+        logger.info("Response cache memory hits: %d, misses: %d", self.memory.hits, self.memory.misses)
+        atexit.unregister(self.close)
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            rows = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                rows.append(item)
+            self._write(rows)
+            for _ in range(len(rows) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, rows: List[Tuple[str, Any, Optional[bytes]]]) -> None:
+        try:
+            with self._disk.transact():
+                for url, data, payload in rows:
+                    self._disk.set(url, payload if payload is not None else orjson.dumps(data), expire=cache_ttl(url, data))
+        except Exception as e:
+            logger.error("Error writing %d cached responses: %s", len(rows), e)
+        with self._lock:
+            for url, data, _ in rows:
+                if self._pending.get(url) is data:
+                    del self._pending[url]
@@ -0,0 +1,121 @@
+"""
+Local caching proxy shared by concurrent and repeated CLI runs.
+
+The daemon owns the on-disk response cache: it is the only process writing to it,
+and other runs route their API requests through it when it is reachable, so they
+start with everything earlier runs have fetched.
+"""
+
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import orjson
+import requests
+from requests.exceptions import RequestException
+
+from api_client import APIClient
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8787
+
+# Path prefixes served by the daemon, mapped to the upstream API they proxy
+UPSTREAMS = {
+    "/blockstream/": "https://blockstream.info/api/",
+    "/coingecko/": "https://api.coingecko.com/api/v3/",
+}
+
+def daemon_url(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> str:
+    """
+    Get the base URL of the cache daemon.
+
+    Parameters:
+    - host (str): The daemon host.
+    - port (int): The daemon port.
+
+    Returns:
+    - str: The base URL, without a trailing slash.
+    """
+    return f"http://{host}:{port}"
+
+def is_daemon_running(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 0.2) -> bool:
+    """
+    Check whether a cache daemon answers on the given address.
+
+    Parameters:
+    - host (str): The daemon host.
+    - port (int): The daemon port.
+    - timeout (float): Time to wait for the health check, in seconds.
+
+    Returns:
+    - bool: True if the daemon is reachable.
+    """
+    try:
+        response = requests.get(f"{daemon_url(host, port)}/health", timeout=timeout)
+        return response.ok and response.content == b"ok"
+    except RequestException:
+        return False
+
+
+class CacheDaemonHandler(BaseHTTPRequestHandler):
+    """
+    Serves proxied API responses from the daemon's cache, fetching them upstream on a miss.
+    """
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send(200, b"ok", "text/plain")
+            return
+        upstream_url = self._upstream_url()
+        if upstream_url is None:
+            self._send(404, b'{"error": "unknown path"}')
+            return
+        data, status = self.server.api_client._make_request_with_status(upstream_url)
+        if data is None:
+            # Pass upstream errors such as 404 through, so clients do not retry them or read them as overload
+            status = status if status is not None and status >= 400 else 502
+            self._send(status, b'{"error": "upstream request failed"}')
+            return
+        self._send(200, orjson.dumps(data))
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _upstream_url(self) -> Optional[str]:
+        for prefix, upstream in UPSTREAMS.items():
+            if self.path.startswith(prefix):
+                return upstream + self.path[len(prefix):]
+        return None
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(cache_dir: str = 'cache', host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+    """
+    Run the cache daemon until interrupted.
+
+    Parameters:
+    - cache_dir (str): Directory of the response cache owned by the daemon.
+    - host (str): The address to listen on.
+    - port (int): The port to listen on.
+    """
+    api_client = APIClient(cache_dir=cache_dir)
+    server = ThreadingHTTPServer((host, port), CacheDaemonHandler)
+    server.daemon_threads = True
+    server.api_client = api_client
+    logger.info("Cache daemon listening on %s", daemon_url(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping cache daemon")
+    finally:
+        server.server_close()
+        api_client.close()
@@ -15,4 +15,5 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument("--cluster-depth", type=int, default=2, help="Depth for wallet cluster analysis")
     parser.add_argument("--large-tx-threshold", type=float, default=10, help="Threshold for large transaction detection (in BTC)")
     parser.add_argument("--output", default="report.json", help="Output file for analysis results")
+    parser.add_argument("--cache-daemon", action="store_true", help="Run the local cache daemon shared by other runs instead of analyzing")
     return parser.parse_args()
@@ -6,30 +6,33 @@ It leverages the `AddressAnalyzer` and `APIClient` classes to interact with the
 
 Modules:
     - argparse: For parsing command-line arguments.
-    - json: For handling JSON data.
+    - report_writer: For streaming the JSON report (serialized with orjson).
     - logging: For logging information.
     - typing: For type hinting.
     - analyzer: Custom module for address analysis.
     - api_client: Custom module for API interactions.
+    - cache_daemon: Custom module for the local cache daemon shared across runs.
 
 Functions:
     - parse_arguments: Parses command-line arguments.
-    - analyze_addresses: Analyzes Bitcoin addresses for wallet clustering and transaction flows.
-    - trace_transaction: Recursively traces a single transaction.
+    - iter_address_reports: Traces the transaction flows of Bitcoin addresses.
+    - iter_transaction_flow: Walks the spending flow of a single transaction.
     - analyze_block: Analyzes a block for large transactions.
     - main: Entry point of the script.
 
 Usage:
     python script_name.py --addresses <addresses> --transaction <txid> --block <block_hash> --output <output_file>
+    python script_name.py --cache-daemon
 """
 
-import json
 import logging
 
 from cli import parse_arguments
 from analyzer import AddressAnalyzer
-from utils import analyze_addresses, trace_transaction, analyze_block
+from utils import flow_to_dict, iter_address_reports, iter_transaction_flow, analyze_block
 from api_client import APIClient
+from cache_daemon import daemon_url, is_daemon_running, serve
+from report_writer import JSONReportWriter, dumps
 from visualization import visualize_cluster
 
 # Configure logging
@@ -42,36 +45,53 @@ def main():
     Parses arguments and performs analysis based on the provided options.
     """
     args = parse_arguments()
-    analyzer = AddressAnalyzer(APIClient())
-    report = {"addresses": [], "transaction": None, "block": None}
+    if args.cache_daemon:
+        serve()
+        return
 
-    if args.addresses:
-        addresses_report = analyze_addresses(analyzer, args.addresses, args.flow_depth, args.cluster_depth)
-        report["addresses"].extend(addresses_report["addresses"])
-        report["clusters"] = addresses_report["clusters"]
-        print(json.dumps(addresses_report, indent=2))
-
-    if args.transaction:
-        logger.info(f"Analyzing transaction: {args.transaction}")
-        transaction_report = trace_transaction(analyzer, args.transaction, args.flow_depth)
-        report["transaction"] = transaction_report
-        print(json.dumps(transaction_report, indent=2))
-
-    if args.block:
-        logger.info(f"Analyzing block: {args.block}")
-        block_report = analyze_block(analyzer, args.block, args.large_tx_threshold)
-        report["block"] = block_report
-        print(json.dumps(block_report, indent=2))
+    analyzer = AddressAnalyzer(APIClient(cache_daemon=daemon_url() if is_daemon_running() else None))
+    # Only the address reports are kept in memory, for the cluster visualization
+    address_reports = []
 
     if not (args.addresses or args.transaction or args.block):
         logger.warning("Please specify addresses, a transaction, or a block to analyze")
 
-    with open(args.output, 'w') as f:
-        json.dump(report, f, indent=2)
-    logger.info(f"Full report saved to {args.output}")
+    # The report is streamed to the output file: address reports and flow records are
+    # written as soon as they are computed instead of being dumped at the end
+    with open(args.output, 'w') as f, JSONReportWriter(f, default=flow_to_dict) as writer:
+        with writer.array("addresses") as addresses:
+            if args.addresses:
+                logger.info("Analyzing addresses: %s", args.addresses)
+                for address_report in iter_address_reports(analyzer, args.addresses, args.flow_depth):
+                    addresses.append(address_report)
+                    address_reports.append(address_report)
+                    print(dumps(address_report, default=flow_to_dict))
+
+        if args.transaction:
+            logger.info("Analyzing transaction: %s", args.transaction)
+            with writer.array("transaction") as flow:
+                for record in iter_transaction_flow(analyzer, args.transaction, args.flow_depth):
+                    flow.append(record)
+                    print(dumps(record, default=flow_to_dict))
+        else:
+            writer.write_field("transaction", None)
+
+        block_report = None
+        if args.block:
+            logger.info("Analyzing block: %s", args.block)
+            block_report = analyze_block(analyzer, args.block, args.large_tx_threshold)
+            print(dumps(block_report))
+        writer.write_field("block", block_report)
+
+        if args.addresses:
+            clusters = analyzer.analyze_wallet_cluster(args.addresses, depth=args.cluster_depth)
+            print(dumps({"clusters": clusters}))
+            writer.write_field("clusters", clusters)
+    logger.info("Full report saved to %s", args.output)
+    analyzer.api_client.close()
 
     if args.addresses:
-        visualize_cluster(report)
+        visualize_cluster({"addresses": address_reports})
     
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Mapping, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limiter for outgoing API requests.
+
+    The concurrency limit grows additively while responses are healthy and is cut
+    multiplicatively on 429/5xx responses or when the rolling average latency exceeds
+    the target (AIMD). An exhausted `X-RateLimit-Remaining` quota also cuts the limit,
+    `Retry-After` pauses new requests, and an optional sliding window caps the number
+    of requests started per minute.
+    """
+
+    def __init__(self, min_concurrency: int = 1, max_concurrency: int = 16, alpha: float = 0.5,
+                 beta: float = 0.5, target_latency: float = 0.5, window: int = 32,
+                 requests_per_minute: Optional[int] = None):
+        """
+        Initialize the limiter.
+
+        Parameters:
+        - min_concurrency (int): Lower bound of the concurrency limit (C_min).
+        - max_concurrency (int): Upper bound of the concurrency limit (C_max).
+        - alpha (float): Additive increase applied after each healthy response.
+        - beta (float): Multiplicative decrease applied on overload.
+        - target_latency (float): Rolling average latency, in seconds, above which the limit is decreased.
+        - window (int): Number of latency samples in the rolling average.
+        - requests_per_minute (Optional[int]): Maximum requests started per 60 seconds, or None for no cap.
+        """
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.alpha = alpha
+        self.beta = beta
+        self.target_latency = target_latency
+        self.requests_per_minute = requests_per_minute
+        self.limit = float(min_concurrency)
+        self._active = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._started: Deque[float] = deque()
+        self._paused_until = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """
+        Wait until a request may be started under the current limits.
+        """
+        async with self._condition:
+            try:
+                await self._condition.wait_for(lambda: self._active < int(self.limit))
+            except BaseException:
+                # A cancelled waiter may have been woken for a free slot; hand that wakeup on
+                if self._active < int(self.limit):
+                    self._condition.notify(1)
+                raise
+            self._active += 1
+        try:
+            await self._wait_for_pause()
+            await self._wait_for_window()
+        except BaseException:
+            await self._finish()
+            raise
+
+    async def release(self, latency: float, status: Optional[int] = None,
+                      headers: Optional[Mapping[str, str]] = None) -> None:
+        """
+        Record the outcome of a request and free its concurrency slot.
+
+        Parameters:
+        - latency (float): Time taken by the request, in seconds.
+        - status (Optional[int]): HTTP status code, or None if the request failed without a response.
+        - headers (Optional[Mapping[str, str]]): Response headers.
+        """
+        headers = headers or {}
+        self._apply_rate_limit_headers(headers)
+        if status is None or status == 429 or status >= 500:
+            self._decrease(f"status {status}")
+        else:
+            self._latencies.append(latency)
+            average = sum(self._latencies) / len(self._latencies)
+            if len(self._latencies) == self._latencies.maxlen and average > self.target_latency:
+                self._decrease(f"average latency {average:.3f}s")
+                self._latencies.clear()
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + self.alpha)
+        await self._finish()
+
+    async def _finish(self) -> None:
+        async with self._condition:
+            self._active -= 1
+            # Wake only as many waiters as there are free slots, so each release costs O(1)
+            # instead of waking, and re-checking, the whole queue
+            free = int(self.limit) - self._active
+            if free > 0:
+                self._condition.notify(free)
+
+    def _decrease(self, reason: str) -> None:
+        self.limit = max(float(self.min_concurrency), self.limit * self.beta)
+        logger.info("Reducing request concurrency to %d (%s)", int(self.limit), reason)
+
+    def _apply_rate_limit_headers(self, headers: Mapping[str, str]) -> None:
+        if headers.get('X-RateLimit-Remaining') == '0':
+            self._decrease("rate limit quota exhausted")
+        retry_after = _parse_retry_after(headers.get('Retry-After'))
+        if retry_after is not None:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    async def _wait_for_pause(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            logger.info("Rate limited by the server, pausing for %.1f seconds", delay)
+            await asyncio.sleep(delay)
+
+    async def _wait_for_window(self) -> None:
+        if self.requests_per_minute is None:
+            return
+        while True:
+            now = time.monotonic()
+            while self._started and now - self._started[0] >= 60:
+                self._started.popleft()
+            if len(self._started) < self.requests_per_minute:
+                self._started.append(now)
+                return
+            await asyncio.sleep(60 - (now - self._started[0]))
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a `Retry-After` header given either in seconds or as an HTTP date.
+
+    Parameters:
+    - value (Optional[str]): The header value.
+
+    Returns:
+    - Optional[float]: The number of seconds to wait, or None if the value is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,122 @@
+from typing import Any, Callable, IO, Optional
+
+import orjson
+
+# orjson serializes several times faster than json and understands NumPy scalars and arrays
+_DUMPS_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+
+class JSONReportWriter:
+    """
+    Writes a JSON object to a file field by field, so large sections can be streamed.
+
+    Use it as a context manager: the enclosing braces are written on enter and exit.
+    """
+
+    def __init__(self, f: IO[str], default: Optional[Callable[[Any], Any]] = None):
+        """
+        Initialize the writer.
+
+        Parameters:
+        - f (IO[str]): The text file to write the report to.
+        - default (Optional[Callable[[Any], Any]]): Converts values that are not natively JSON-serializable.
+        """
+        self._f = f
+        self._default = default
+        self._fields = 0
+
+    def __enter__(self) -> "JSONReportWriter":
+        self._f.write("{")
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._f.write("\n}\n")
+
+    def write_field(self, key: str, value: Any) -> None:
+        """
+        Write a complete field.
+
+        Parameters:
+        - key (str): The field name.
+        - value (Any): The JSON-serializable field value.
+        """
+        self._begin_field(key)
+        self._f.write(_indent(dumps(value, self._default), 1))
+
+    def array(self, key: str) -> "JSONArrayWriter":
+        """
+        Start a field whose array value is written one item at a time.
+
+        Parameters:
+        - key (str): The field name.
+
+        Returns:
+        - JSONArrayWriter: The writer for the array items; close it (or leave its `with` block) to end the field.
+        """
+        self._begin_field(key)
+        return JSONArrayWriter(self._f, self._default)
+
+    def _begin_field(self, key: str) -> None:
+        self._f.write(f"{',' if self._fields else ''}\n  {orjson.dumps(key).decode()}: ")
+        self._fields += 1
+
+
+class JSONArrayWriter:
+    """
+    Writes the items of a JSON array as they are produced.
+    """
+
+    def __init__(self, f: IO[str], default: Optional[Callable[[Any], Any]] = None):
+        """
+        Open the array.
+
+        Parameters:
+        - f (IO[str]): The text file to write the array to.
+        - default (Optional[Callable[[Any], Any]]): Converts values that are not natively JSON-serializable.
+        """
+        self._f = f
+        self._default = default
+        self._items = 0
+        self._closed = False
+        self._f.write("[")
+
+    def __enter__(self) -> "JSONArrayWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def append(self, item: Any) -> None:
+        """
+        Write one array item.
+
+        Parameters:
+        - item (Any): The JSON-serializable item.
+        """
+        self._f.write(f"{',' if self._items else ''}\n    {_indent(dumps(item, self._default), 2)}")
+        self._items += 1
+
+    def close(self) -> None:
+        """
+        Close the array.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._f.write("\n  ]" if self._items else "]")
+
+
+def dumps(value: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+    """
+    Serialize a value to indented JSON.
+
+    Parameters:
+    - value (Any): The value to serialize.
+    - default (Optional[Callable[[Any], Any]]): Converts values that are not natively JSON-serializable.
+
+    Returns:
+    - str: The JSON text.
+    """
+    return orjson.dumps(value, default=default, option=_DUMPS_OPTIONS).decode()
+
+def _indent(text: str, level: int) -> str:
+    return text.replace("\n", "\n" + "  " * level)
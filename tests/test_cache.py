@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta, timezone
+
+import diskcache as dc
+import pytest
+
+import cache
+from cache import ResponseCache, cache_ttl
+
+BASE = "https://blockstream.info/api"
+PRICE = "https://api.coingecko.com/api/v3/coins/bitcoin/history?date="
+CONFIRMED_TX = {"txid": "aa", "status": {"confirmed": True, "block_time": 100}}
+UNCONFIRMED_TX = {"txid": "bb", "status": {"confirmed": False}}
+
+
+def _day(offset: int) -> str:
+    return (datetime.now(timezone.utc) + timedelta(days=offset)).strftime("%d-%m-%Y")
+
+
+@pytest.fixture
+def response_cache(tmp_path):
+    response_cache = ResponseCache(str(tmp_path / "cache"))
+    yield response_cache
+    response_cache.close()
+
+
+def _disk_row(directory, url):
+    with dc.Cache(directory) as disk:
+        return disk.get(url, expire_time=True)
+
+
+@pytest.mark.parametrize("url, data, expected", [
+    (f"{BASE}/tx/aa", CONFIRMED_TX, None),
+    (f"{BASE}/tx/bb", UNCONFIRMED_TX, 60),
+    (f"{BASE}/tx/aa/outspends", [{"spent": True, "status": {"confirmed": True}}], None),
+    (f"{BASE}/tx/aa/outspends", [{"spent": True, "status": {"confirmed": True}}, {"spent": False}], 60),
+    (f"{BASE}/tx/aa/outspend/0", {"spent": True, "status": {"confirmed": False}}, 60),
+    (f"{BASE}/block/00ff", {"id": "00ff"}, None),
+    (f"{BASE}/address/a", {"address": "a"}, 60),
+    (f"{BASE}/address/a/txs", [CONFIRMED_TX], 60),
+    (f"{PRICE}{_day(-1)}", {"market_data": {}}, None),
+    (f"{PRICE}{_day(0)}", {"market_data": {}}, 3600),
+    (f"{PRICE}not-a-date", {}, 3600),
+    ("https://example.com/other", {}, None),
+])
+def test_cache_ttl(url, data, expected):
+    assert cache_ttl(url, data) == expected
+
+
+def test_is_confirmed_rejects_non_dicts():
+    assert cache.is_confirmed(CONFIRMED_TX)
+    assert not cache.is_confirmed(UNCONFIRMED_TX)
+    assert not cache.is_confirmed(None)
+    assert not cache.is_confirmed([CONFIRMED_TX])
+
+
+def test_queued_responses_are_readable_before_flush(tmp_path):
+    response_cache = ResponseCache(str(tmp_path / "cache"), flush_interval=10, memory_size=1)
+    try:
+        response_cache.set(f"{BASE}/tx/aa", CONFIRMED_TX)
+        # Evict the response from memory so it can only be served from the write queue
+        response_cache.set(f"{BASE}/block/00ff", {"id": "00ff"})
+        assert response_cache.get(f"{BASE}/tx/aa") == CONFIRMED_TX
+    finally:
+        response_cache.close()
+
+
+def test_flush_writes_json_bytes_with_expiry(response_cache):
+    response_cache.set(f"{BASE}/tx/aa", CONFIRMED_TX)
+    response_cache.set(f"{BASE}/address/a", {"address": "a"}, b'{"address":"a"}')
+    response_cache.flush()
+    response_cache.close()
+
+    payload, expire = _disk_row(response_cache.directory, f"{BASE}/tx/aa")
+    assert isinstance(payload, bytes) and expire is None
+    payload, expire = _disk_row(response_cache.directory, f"{BASE}/address/a")
+    assert payload == b'{"address":"a"}' and expire is not None
+
+
+def test_close_persists_queued_responses(tmp_path):
+    directory = str(tmp_path / "cache")
+    response_cache = ResponseCache(directory, batch_size=8, flush_interval=10)
+    urls = [f"{BASE}/block/{i:04x}" for i in range(50)]
+    for url in urls:
+        response_cache.set(url, {"id": url})
+    response_cache.close()
+    response_cache.close()
+
+    reopened = ResponseCache(directory)
+    try:
+        assert all(reopened.get(url) == {"id": url} for url in urls)
+    finally:
+        reopened.close()
+
+
+def test_expired_responses_are_misses(monkeypatch, response_cache):
+    monkeypatch.setitem(cache.CACHE_TTL, "/address/", -1)
+    response_cache.set(f"{BASE}/address/a", {"address": "a"})
+    response_cache.flush()
+    assert response_cache.get(f"{BASE}/address/a") is None
+    assert f"{BASE}/address/a" not in response_cache
+
+
+def test_memory_only_cache():
+    response_cache = ResponseCache(None)
+    response_cache[f"{BASE}/tx/aa"] = CONFIRMED_TX
+    response_cache.flush()
+    assert response_cache[f"{BASE}/tx/aa"] == CONFIRMED_TX
+    with pytest.raises(KeyError):
+        response_cache[f"{BASE}/tx/bb"]
+    response_cache.close()
+
+
+def test_legacy_rows_without_expiry(tmp_path):
+    directory = str(tmp_path / "cache")
+    # Earlier versions pickled the decoded responses without an expiry
+    with dc.Cache(directory) as disk:
+        disk.set(f"{BASE}/address/a", {"address": "a"})
+        disk.set(f"{BASE}/tx/bb", UNCONFIRMED_TX)
+        disk.set(f"{BASE}/tx/aa", CONFIRMED_TX)
+
+    response_cache = ResponseCache(directory)
+    try:
+        assert response_cache.get(f"{BASE}/address/a") is None
+        assert response_cache.get(f"{BASE}/tx/bb") is None
+        assert response_cache.get(f"{BASE}/tx/aa") == CONFIRMED_TX
+    finally:
+        response_cache.close()
+
+    payload, expire = _disk_row(directory, f"{BASE}/tx/aa")
+    assert isinstance(payload, bytes) and expire is None
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from rate_limiter import AIMDLimiter, _parse_retry_after
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_healthy_responses_increase_the_limit():
+    async def scenario():
+        limiter = AIMDLimiter(min_concurrency=1, max_concurrency=3, alpha=0.5)
+        limits = []
+        for _ in range(6):
+            await limiter.acquire()
+            await limiter.release(0.01, 200)
+            limits.append(limiter.limit)
+        return limits
+
+    assert _run(scenario()) == [1.5, 2.0, 2.5, 3.0, 3.0, 3.0]
+
+
+@pytest.mark.parametrize("status", [None, 429, 500, 503])
+def test_overload_decreases_the_limit(status):
+    async def scenario():
+        limiter = AIMDLimiter(min_concurrency=2, max_concurrency=16, beta=0.5)
+        limiter.limit = 10.0
+        await limiter.acquire()
+        await limiter.release(0.01, status)
+        first = limiter.limit
+        for _ in range(5):
+            await limiter.acquire()
+            await limiter.release(0.01, status)
+        return first, limiter.limit
+
+    assert _run(scenario()) == (5.0, 2.0)
+
+
+def test_client_errors_are_not_overload():
+    async def scenario():
+        limiter = AIMDLimiter(min_concurrency=1, max_concurrency=16)
+        await limiter.acquire()
+        await limiter.release(0.01, 404)
+        return limiter.limit
+
+    assert _run(scenario()) == 1.5
+
+
+def test_slow_responses_decrease_the_limit():
+    async def scenario():
+        limiter = AIMDLimiter(min_concurrency=1, max_concurrency=16, target_latency=0.1, window=2)
+        limiter.limit = 8.0
+        for _ in range(2):
+            await limiter.acquire()
+            await limiter.release(1.0, 200)
+        return limiter.limit
+
+    # The first slow response is still healthy; the full window then averages above the target
+    assert _run(scenario()) == 4.25
+
+
+def test_exhausted_quota_decreases_the_limit():
+    async def scenario():
+        limiter = AIMDLimiter(min_concurrency=1, max_concurrency=16)
+        limiter.limit = 8.0
+        await limiter.acquire()
+        await limiter.release(0.01, 200, {"X-RateLimit-Remaining": "0"})
+        return limiter.limit
+
+    assert _run(scenario()) == 4.5
+
+
+def test_retry_after_pauses_new_requests():
+    async def scenario():
+        limiter = AIMDLimiter(min_concurrency=2, max_concurrency=16)
+        await limiter.acquire()
+        await limiter.release(0.01, 429, {"Retry-After": "0.2"})
+        start = time.monotonic()
+        await limiter.acquire()
+        elapsed = time.monotonic() - start
+        await limiter.release(0.01, 200)
+        return elapsed
+
+    assert _run(scenario()) >= 0.19
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None),
+    ("", None),
+    ("1.5", 1.5),
+    ("-3", 0.0),
+    ("soon", None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert _parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    value = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < _parse_retry_after(value) <= 30
+
+
+def test_requests_per_minute_caps_started_requests():
+    async def scenario():
+        limiter = AIMDLimiter(min_concurrency=4, max_concurrency=4, requests_per_minute=2)
+        for _ in range(2):
+            await limiter.acquire()
+            await limiter.release(0.01, 200)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire(), 0.05)
+        return limiter._active
+
+    assert _run(scenario()) == 0
+
+
+def test_concurrency_stays_within_the_limit():
+    async def scenario():
+        limiter = AIMDLimiter(min_concurrency=4, max_concurrency=4)
+        active = peak = 0
+
+        async def request():
+            nonlocal active, peak
+            await limiter.acquire()
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0)
+            active -= 1
+            await limiter.release(0.01, 200)
+
+        await asyncio.wait_for(asyncio.gather(*(request() for _ in range(500))), 5)
+        return peak, limiter._active
+
+    assert _run(scenario()) == (4, 0)
+
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def scenario():
+        limiter = AIMDLimiter(min_concurrency=1, max_concurrency=1)
+        await limiter.acquire()
+        first = asyncio.ensure_future(limiter.acquire())
+        second = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        await limiter.release(0.01, 200)
+        first.cancel()
+        await asyncio.wait_for(second, 1)
+        return limiter._active
+
+    assert _run(scenario()) == 1
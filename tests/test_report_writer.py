@@ -0,0 +1,71 @@
+import io
+import json
+
+import numpy as np
+
+from report_writer import JSONReportWriter, dumps
+
+
+def _write(build, default=None) -> str:
+    f = io.StringIO()
+    with JSONReportWriter(f, default=default) as writer:
+        build(writer)
+    return f.getvalue()
+
+
+def test_fields_and_arrays_produce_valid_json():
+    def build(writer):
+        with writer.array("addresses") as addresses:
+            addresses.append({"address": "a", "transactions_flow": [{"txid": "aa", "outputs": []}]})
+            addresses.append({"address": "b", "transactions_flow": []})
+        writer.write_field("transaction", None)
+        with writer.array("flow") as flow:
+            flow.append([1, 2])
+        writer.write_field("block", {"block_info": {"id": "00"}, "large_transactions": []})
+
+    assert json.loads(_write(build)) == {
+        "addresses": [
+            {"address": "a", "transactions_flow": [{"txid": "aa", "outputs": []}]},
+            {"address": "b", "transactions_flow": []},
+        ],
+        "transaction": None,
+        "flow": [[1, 2]],
+        "block": {"block_info": {"id": "00"}, "large_transactions": []},
+    }
+
+
+def test_empty_report_and_arrays():
+    assert json.loads(_write(lambda writer: None)) == {}
+
+    def build(writer):
+        with writer.array("addresses"):
+            pass
+        writer.write_field("clusters", None)
+
+    assert json.loads(_write(build)) == {"addresses": [], "clusters": None}
+
+
+def test_array_close_is_idempotent():
+    def build(writer):
+        addresses = writer.array("addresses")
+        addresses.append("a")
+        addresses.close()
+        addresses.close()
+
+    assert json.loads(_write(build)) == {"addresses": ["a"]}
+
+
+def test_default_hook_and_numpy_values():
+    def build(writer):
+        writer.write_field("values", np.array([1, 2], dtype=np.int64))
+        with writer.array("sets") as sets:
+            sets.append({"members": frozenset(["a"])})
+
+    report = json.loads(_write(build, default=lambda obj: sorted(obj)))
+    assert report == {"values": [1, 2], "sets": [{"members": ["a"]}]}
+
+
+def test_nested_values_keep_their_text():
+    value = {"note": "line\nbreak", "nested": {"list": [{"a": 1}]}}
+    assert json.loads(dumps(value)) == value
+    assert json.loads(_write(lambda writer: writer.write_field("value", value))) == {"value": value}
@@ -1,9 +1,78 @@
+import asyncio
 import logging
-from typing import Any, Dict, List
+import numpy as np
+from collections import deque
+from itertools import chain, repeat
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
 from analyzer import AddressAnalyzer
+from api_client import UNSPENDABLE_SCRIPT_TYPES, AsyncAPIClient
+from cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on the transactions fetched by a single flow trace
+MAX_TRACED_TRANSACTIONS = 10_000
+
+# Upper bound on the transactions fetched concurrently by a breadth-first flow trace
+MAX_CONCURRENT_TRACES = 32
+
+# Blocks with at least this many transactions are filtered with NumPy; smaller ones are
+# cheaper to filter in a plain comprehension than to copy into an array
+VECTORIZED_BLOCK_MIN_TXS = 10_000
+
+# Block reports already computed, keyed by (block hash, large transaction threshold)
+_block_reports = LRUCache(256)
+
+
+class OutputRef(NamedTuple):
+    """
+    An output of a traced transaction; spent outputs name their spending transaction in `spent_by`.
+    """
+    address: str
+    value: float
+    status: str
+    spent_by: Optional[str] = None
+
+
+class TraceNode(NamedTuple):
+    """
+    A transaction in a traced flow tree.
+
+    Traced transactions carry their inputs and outputs, where each spent output is the
+    `TraceNode` of its spending transaction, and their `block_time` (None while
+    unconfirmed); transactions that were not traced carry a `status` instead.
+    """
+    txid: str
+    status: str = ''
+    inputs: Sequence[Dict[str, Any]] = ()
+    outputs: Sequence[Any] = ()
+    block_time: Optional[int] = None
+
+
+def flow_to_dict(obj: Any) -> Dict[str, Any]:
+    """
+    Convert a `TraceNode` or `OutputRef` to its JSON representation.
+
+    Suitable as the `default` hook of a JSON serializer, which applies it again to the nested nodes.
+
+    Args:
+        obj (Any): The object to convert.
+
+    Returns:
+        Dict[str, Any]: The JSON-serializable representation.
+    """
+    if isinstance(obj, TraceNode):
+        if obj.status:
+            return {"txid": obj.txid, "status": obj.status}
+        return {"txid": obj.txid, "block_time": obj.block_time, "inputs": obj.inputs, "outputs": obj.outputs}
+    if isinstance(obj, OutputRef):
+        data = {"address": obj.address, "value": obj.value, "status": obj.status}
+        if obj.spent_by is not None:
+            data["spent_by"] = obj.spent_by
+        return data
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
 def analyze_addresses(analyzer: AddressAnalyzer, addresses: List[str], flow_depth: int, cluster_depth: int) -> Dict[str, Any]:
     """
     Analyze Bitcoin addresses for wallet clustering and transaction flows.
@@ -17,66 +86,306 @@ def analyze_addresses(analyzer: AddressAnalyzer, addresses: List[str], flow_dept
     Returns:
         Dict[str, Any]: Analysis report for the addresses.
     """
-    logger.info(f"Analyzing addresses: {addresses}")
-    address_reports = []
-    for address in addresses:
-        transactions = analyzer.get_transactions(address)
-        transactions_flow = [trace_transaction(analyzer, tx['txid'], flow_depth) for tx in transactions]
-        address_reports.append({
-            "address": address,
-            "transactions_flow": transactions_flow
-        })
+    logger.info("Analyzing addresses: %s", addresses)
+    address_reports = list(iter_address_reports(analyzer, addresses, flow_depth))
     clusters = analyzer.analyze_wallet_cluster(addresses, depth=cluster_depth)
     return {
         "addresses": address_reports,
         "clusters": clusters
     }
 
-def trace_transaction(analyzer: AddressAnalyzer, txid: str, depth: int, current_depth: int = 0) -> Dict[str, Any]:
+def iter_address_reports(analyzer: AddressAnalyzer, addresses: List[str], flow_depth: int) -> Iterator[Dict[str, Any]]:
+    """
+    Trace the transaction flows of Bitcoin addresses, yielding one report per address.
+
+    The addresses are traced concurrently on one event loop, so all requests share one
+    client and one rate limiter. Reports are yielded in the order of `addresses`, each
+    as soon as the flows of its address are traced.
+
+    Args:
+        analyzer (AddressAnalyzer): Instance of AddressAnalyzer.
+        addresses (List[str]): List of Bitcoin addresses to analyze.
+        flow_depth (int): Depth for transaction flow analysis.
+
+    Yields:
+        Dict[str, Any]: Analysis report of one address.
+    """
+    if not addresses:
+        return
+    loop = asyncio.new_event_loop()
+    reports = _iter_address_reports_async(analyzer, addresses, flow_depth)
+    try:
+        # The traces only progress while a report is awaited, so a slow consumer never buffers more than one
+        while True:
+            try:
+                yield loop.run_until_complete(reports.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(reports.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+async def _iter_address_reports_async(analyzer: AddressAnalyzer, addresses: List[str],
+                                      flow_depth: int) -> AsyncIterator[Dict[str, Any]]:
+    async with AsyncAPIClient.from_client(analyzer.api_client, max_workers=analyzer.max_workers) as client:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_TRACES)
+        tasks = [asyncio.ensure_future(_trace_address(client, address, flow_depth, semaphore)) for address in addresses]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _trace_address(client: AsyncAPIClient, address: str, flow_depth: int,
+                         semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    transactions = await client.get_transactions(address)
+    if transactions is None:
+        logger.error("Unable to retrieve transactions for address: %s", address)
+        transactions = []
+    flows = await trace_flow_bfs(client, [tx['txid'] for tx in transactions], flow_depth, semaphore=semaphore)
+    return {
+        "address": address,
+        "transactions_flow": flows
+    }
+
+def iter_transaction_flow(analyzer: AddressAnalyzer, txid: str, depth: int,
+                          max_transactions: int = MAX_TRACED_TRANSACTIONS,
+                          visited: Optional[Set[str]] = None) -> Iterator[Dict[str, Any]]:
     """
-    Recursively trace a single transaction.
+    Walk the spending flow of a transaction depth-first, yielding one record per visited transaction.
+
+    The walk uses an explicit stack and a set of visited txids, so each transaction is
+    fetched at most once and at most `max_transactions` transactions are traced. Records
+    are yielded as soon as they are fetched, parents before their children, so callers
+    can stream them instead of holding the whole flow in memory.
+
+    Every record has the "txid", its "depth", and the "parent" txid and "vout" index of
+    the output it was reached through (None for the root). Traced transactions carry
+    their "block_time" (None while unconfirmed), "inputs" and "outputs" (as `OutputRef`s,
+    see `flow_to_dict`), where spent outputs name the spending transaction in `spent_by`;
+    transactions that were not traced carry a "status" instead.
 
     Args:
         analyzer (AddressAnalyzer): Instance of AddressAnalyzer.
         txid (str): Transaction ID to trace.
         depth (int): Depth for transaction flow analysis.
-        current_depth (int): Current recursion depth.
+        max_transactions (int): Maximum number of transactions to trace.
+        visited (Optional[Set[str]]): Txids already traced, updated in place; pass the same set to
+            several walks so a transaction is fetched by only one of them.
 
-    Returns:
-        Dict[str, Any]: Traced transaction information.
+    Yields:
+        Dict[str, Any]: Flow record of a visited transaction.
     """
-    if current_depth >= depth:
-        return {"txid": txid, "status": "max depth reached"}
-    
-    try:
-        tx_info = analyzer.api_client.get_transaction_info(txid)
-        if not tx_info:
-            return {"txid": txid, "status": "transaction not found"}
-    except Exception as e:
-        logger.error(f"Error fetching transaction info for {txid}: {e}")
-        return {"txid": txid, "status": "error fetching transaction info"}
-    
-    outputs = []
-    for vout in tx_info.get('vout', []):
+    stack = [(txid, 0, None, None)]
+    if visited is None:
+        visited = set()
+    traced = 0
+    while stack:
+        txid, level, parent, vout_index = stack.pop()
+        record: Dict[str, Any] = {"txid": txid, "depth": level, "parent": parent, "vout": vout_index}
+        if level >= depth:
+            record["status"] = "max depth reached"
+        elif txid in visited:
+            record["status"] = "already traced"
+        elif traced >= max_transactions:
+            record["status"] = "trace limit reached"
+        if "status" in record:
+            yield record
+            continue
+        visited.add(txid)
+        traced += 1
+
+        try:
+            tx_info = analyzer.api_client.get_transaction_info(txid)
+            if not tx_info:
+                record["status"] = "transaction not found"
+        except Exception as e:
+            logger.error("Error fetching transaction info for %s: %s", txid, e)
+            record["status"] = "error fetching transaction info"
+        if "status" in record:
+            yield record
+            continue
+
         try:
-            spending_tx = analyzer.api_client.get_spending_tx(txid, vout.get('n', 0))
-            if spending_tx and spending_tx['spent']:
-                outputs.append(trace_transaction(analyzer, spending_tx['txid'], depth, current_depth + 1))
-            else:
-                outputs.append({
-                    "address": vout.get('scriptpubkey_address', 'Unknown'),
-                    "value": vout.get('value', 0) / 1e8,
-                    "status": "unspent"
-                })
+            outspends = analyzer.api_client.get_all_outspends(txid, tx_info.get('vout', [])) or []
         except Exception as e:
-            logger.error(f"Error processing output for {txid}: {e}")
-            outputs.append({
-                "address": vout.get('scriptpubkey_address', 'Unknown'),
-                "value": vout.get('value', 0) / 1e8,
-                "status": "error processing output"
-            })
-    
-    return {"txid": txid, "inputs": tx_info.get('vin', []), "outputs": outputs}
+            logger.error("Error fetching spending transactions for %s: %s", txid, e)
+            outspends = []
+
+        record["block_time"] = tx_info.get('status', {}).get('block_time')
+        record["inputs"] = tx_info.get('vin', [])
+        record["outputs"] = _flow_outputs(txid, tx_info, outspends)
+        yield record
+        # Push in reverse so outputs are followed in order
+        stack.extend((output.spent_by, level + 1, txid, index)
+                     for index, output in reversed(list(enumerate(record["outputs"])))
+                     if output.status == "spent")
+
+def _flow_outputs(txid: str, tx_info: Dict[str, Any], outspends: List[Dict[str, Any]]) -> List[OutputRef]:
+    """
+    Describe the outputs of a traced transaction, naming the spending transaction of spent outputs in `spent_by`.
+
+    Args:
+        txid (str): Transaction ID of the traced transaction.
+        tx_info (Dict[str, Any]): The transaction.
+        outspends (List[Dict[str, Any]]): Spending status of the outputs, indexed by output position.
+
+    Returns:
+        List[OutputRef]: Flow record outputs.
+    """
+    outputs = []
+    # Outputs without a spending status read as unspent
+    for vout, spending_tx in zip(tx_info.get('vout', []), chain(outspends, repeat(None))):
+        status, spent_by = "unspent", None
+        if vout.get('scriptpubkey_type') in UNSPENDABLE_SCRIPT_TYPES:
+            # Provably unspendable, whatever the spending status says
+            status = "unspendable"
+        elif spending_tx:
+            try:
+                if spending_tx['spent']:
+                    status, spent_by = "spent", spending_tx['txid']
+            except Exception as e:
+                logger.error("Error processing output for %s: %s", txid, e)
+                status = "error processing output"
+        outputs.append(OutputRef(vout.get('scriptpubkey_address', 'Unknown'), vout.get('value', 0) / 1e8, status, spent_by))
+    return outputs
+
+def trace_transaction(analyzer: AddressAnalyzer, txid: str, depth: int, visited: Optional[Set[str]] = None) -> TraceNode:
+    """
+    Trace a single transaction into a nested tree of spending transactions.
+
+    Args:
+        analyzer (AddressAnalyzer): Instance of AddressAnalyzer.
+        txid (str): Transaction ID to trace.
+        depth (int): Depth for transaction flow analysis.
+        visited (Optional[Set[str]]): Txids already traced, shared between traces; see `iter_transaction_flow`.
+
+    Returns:
+        TraceNode: Traced transaction information, where each spent output is replaced by the trace of its spending transaction.
+    """
+    root = TraceNode(txid)
+    # Spent output slots waiting for their spending transaction, keyed by (txid, output index)
+    slots: Dict[Tuple[str, int], List[Any]] = {}
+    for record in iter_transaction_flow(analyzer, txid, depth, visited=visited):
+        if "status" in record:
+            node = TraceNode(record["txid"], status=record["status"])
+        else:
+            node = TraceNode(record["txid"], inputs=record["inputs"], outputs=list(record["outputs"]),
+                             block_time=record["block_time"])
+            for index, output in enumerate(node.outputs):
+                if output.status == "spent":
+                    slots[(record["txid"], index)] = node.outputs
+
+        if record["parent"] is None:
+            root = node
+        else:
+            slots.pop((record["parent"], record["vout"]))[record["vout"]] = node
+    return root
+
+async def trace_flow_bfs(client: AsyncAPIClient, root_txids: List[str], depth: int,
+                         semaphore: Optional[asyncio.Semaphore] = None,
+                         max_transactions: int = MAX_TRACED_TRANSACTIONS) -> List[TraceNode]:
+    """
+    Trace the spending flows of several transactions breadth-first, one concurrent fetch per depth level.
+
+    All transactions at a level, across every root, are fetched together with their
+    output spends before the next level is expanded, so a trace costs one round of
+    requests per level instead of one per transaction, and each transaction is fetched
+    at most once. The nested trees are rebuilt from the fetched transactions afterwards;
+    within a tree, the shallowest occurrence of a repeated transaction is expanded and
+    the others are marked "already traced".
+
+    Args:
+        client (AsyncAPIClient): Async API client to fetch transactions with.
+        root_txids (List[str]): Transaction IDs to trace.
+        depth (int): Depth for transaction flow analysis.
+        semaphore (Optional[asyncio.Semaphore]): Bounds the transactions fetched at once; defaults to `MAX_CONCURRENT_TRACES`.
+        max_transactions (int): Maximum number of transactions fetched for all roots together.
+
+    Returns:
+        List[TraceNode]: The trace of each root, in the shape built by `trace_transaction`.
+    """
+    semaphore = semaphore or asyncio.Semaphore(MAX_CONCURRENT_TRACES)
+    # Flow records of the fetched transactions, keyed by txid
+    results: Dict[str, Dict[str, Any]] = {}
+    frontier = list(dict.fromkeys(root_txids))
+    for level in range(depth):
+        if not frontier:
+            break
+        frontier = frontier[:max_transactions - len(results)]
+        logger.info("Tracing %d transactions at depth %d", len(frontier), level)
+        records = await asyncio.gather(*(_fetch_flow_record(client, txid, semaphore) for txid in frontier))
+        results.update(zip(frontier, records))
+        frontier = list(dict.fromkeys(
+            output.spent_by
+            for record in records
+            for output in record.get("outputs", [])
+            if output.status == "spent" and output.spent_by not in results
+        ))
+    return [_build_flow_tree(results, txid, depth) for txid in root_txids]
+
+async def _fetch_flow_record(client: AsyncAPIClient, txid: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    async with semaphore:
+        tx_info, outspends = await asyncio.gather(client.get_transaction_info(txid), client.get_spending_txs_bulk(txid),
+                                                  return_exceptions=True)
+    if isinstance(tx_info, Exception):
+        logger.error("Error fetching transaction info for %s: %s", txid, tx_info)
+        return {"status": "error fetching transaction info"}
+    if not tx_info:
+        return {"status": "transaction not found"}
+    if isinstance(outspends, Exception):
+        logger.error("Error fetching spending transactions for %s: %s", txid, outspends)
+        outspends = []
+    elif outspends is None:
+        # The bulk request was fetched alongside the transaction; fall back to one request per output
+        async with semaphore:
+            outspends = await client.get_outspends_by_output(txid, tx_info.get('vout', []))
+    return {"block_time": tx_info.get('status', {}).get('block_time'), "inputs": tx_info.get('vin', []),
+            "outputs": _flow_outputs(txid, tx_info, outspends)}
+
+def _build_flow_tree(results: Dict[str, Dict[str, Any]], txid: str, depth: int) -> TraceNode:
+    """
+    Rebuild the nested trace of a root transaction from the flow records fetched by `trace_flow_bfs`.
+
+    Args:
+        results (Dict[str, Dict[str, Any]]): Flow records keyed by txid.
+        txid (str): Transaction ID of the root.
+        depth (int): Depth for transaction flow analysis.
+
+    Returns:
+        TraceNode: Traced transaction information, where each spent output is replaced by the trace of its spending transaction.
+    """
+    root = TraceNode(txid)
+    visited: Set[str] = set()
+    # (txid, level, outputs list of the parent, output index) in breadth-first order
+    queue = deque([(txid, 0, None, 0)])
+    while queue:
+        txid, level, slots, index = queue.popleft()
+        record = results.get(txid)
+        if level >= depth:
+            node = TraceNode(txid, status="max depth reached")
+        elif txid in visited:
+            node = TraceNode(txid, status="already traced")
+        elif record is None:
+            node = TraceNode(txid, status="trace limit reached")
+        elif "status" in record:
+            visited.add(txid)
+            node = TraceNode(txid, status=record["status"])
+        else:
+            visited.add(txid)
+            node = TraceNode(txid, inputs=record["inputs"], outputs=list(record["outputs"]), block_time=record["block_time"])
+            for vout, output in enumerate(node.outputs):
+                if output.status == "spent":
+                    queue.append((output.spent_by, level + 1, node.outputs, vout))
+
+        if slots is None:
+            root = node
+        else:
+            slots[index] = node
+    return root
 
 def analyze_block(analyzer: AddressAnalyzer, block_hash: str, large_tx_threshold: float) -> Dict[str, Any]:
     """
@@ -90,7 +399,20 @@ def analyze_block(analyzer: AddressAnalyzer, block_hash: str, large_tx_threshold
     Returns:
         Dict[str, Any]: Analysis report for the block.
     """
-    logger.info(f"Analyzing block: {block_hash}")
+    logger.info("Analyzing block: %s", block_hash)
+    report = _block_reports.get((block_hash, large_tx_threshold))
+    if report is not None:
+        return report
     block_info = analyzer.api_client.get_block_info(block_hash)
-    large_txs = [tx for tx in block_info.get('tx', []) if tx.get('value', 0) / 1e8 > large_tx_threshold]
-    return {"block_info": block_info, "large_transactions": large_txs}
+    txs = block_info.get('tx', ())
+    # Compare in integer satoshis instead of dividing every value by 1e8
+    threshold_sat = round(large_tx_threshold * 1e8)
+    if len(txs) < VECTORIZED_BLOCK_MIN_TXS:
+        large_txs = [tx for tx in txs if tx.get('value', 0) > threshold_sat]
+    else:
+        values = np.fromiter((tx.get('value', 0) for tx in txs), dtype=np.int64, count=len(txs))
+        large_txs = [txs[i] for i in np.flatnonzero(values > threshold_sat)]
+    report = {"block_info": block_info, "large_transactions": large_txs}
+    if block_info:
+        _block_reports[(block_hash, large_tx_threshold)] = report
+    return report
@@ -1,119 +1,304 @@
-import networkx as nx
-import matplotlib.pyplot as plt
-import pandas as pd
+# matplotlib, networkx and pandas take hundreds of milliseconds to import, so they are
+# imported inside the functions that use them and runs that do not plot never load them
+import heapq
+import time
+import numpy as np
 import logging
-from typing import Any, Dict, List
-import networkx as nx
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+from cache import LRUCache
+from utils import OutputRef, TraceNode
+
+if TYPE_CHECKING:
+    import networkx as nx
+    from matplotlib.figure import Figure
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def visualize_cluster(cluster_report: Dict[str, Any]) -> None:
+# Largest number of nodes drawn by visualize_cluster, OTHERS_NODE included. networkx's spring
+# layout needs scipy from 500 nodes on, and scipy is not a dependency, so stay below that.
+MAX_CLUSTER_NODES = 499
+OTHERS_NODE = "…others"
+
+# Node positions of the most recently laid out graphs, keyed by their nodes and edges
+LAYOUT_CACHE_SIZE = 16
+_layout_cache = LRUCache(LAYOUT_CACHE_SIZE)
+
+def _new_figure(figsize, show: bool) -> "Figure":
     """
-    Visualize the cluster of Bitcoin addresses.
+    Create a figure, keeping figures that are only saved out of pyplot.
+
+    A standalone `Figure` renders with the Agg canvas and is not registered with
+    pyplot, so no GUI backend is involved and nothing outlives the caller.
 
     Args:
-        cluster_report (Dict[str, Any]): The report containing the cluster information.
+        figsize: Figure size in inches.
+        show (bool): Whether the figure will be displayed.
+
+    Returns:
+        Figure: The new figure.
     """
-    G = nx.Graph()
+    if show:
+        import matplotlib.pyplot as plt
+        return plt.figure(figsize=figsize)
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize)
+
+def _finish_figure(fig: "Figure", save_path: Optional[str], show: bool) -> None:
+    """
+    Save and/or display a figure, then release it.
+
+    Args:
+        fig (Figure): The figure to finish.
+        save_path (Optional[str]): File to save the figure to, if any.
+        show (bool): Whether to display the figure.
+    """
+    if not show:
+        # Standalone figures are not registered with pyplot and are freed with their last reference
+        if save_path:
+            fig.savefig(save_path)
+        return
+    import matplotlib.pyplot as plt
+    try:
+        if save_path:
+            fig.savefig(save_path)
+        plt.show()
+    finally:
+        plt.close(fig)
+
+class Interner:
+    """
+    Maps strings such as addresses and txids to small, incremental integer IDs.
+
+    Graphs keyed by these IDs hash ints instead of long strings and hold one copy of
+    each string; the strings are looked up again only for display.
+    """
+
+    def __init__(self):
+        self.s2i: Dict[str, int] = {}
+        self.i2s: List[str] = []
+
+    def id(self, s: str) -> int:
+        """
+        Get the ID of a string, assigning the next free ID to new strings.
+
+        Args:
+            s (str): The string to intern.
+
+        Returns:
+            int: The ID of the string.
+        """
+        i = self.s2i.get(s)
+        if i is None:
+            i = len(self.i2s)
+            self.s2i[s] = i
+            self.i2s.append(s)
+        return i
+
+def _prune_graph(G: "nx.Graph", max_nodes: int, others: Any = OTHERS_NODE) -> "nx.Graph":
+    """
+    Keep the highest-degree nodes of a graph, merging all other nodes into a single `others` node.
+
+    Args:
+        G (nx.Graph): The graph to prune.
+        max_nodes (int): Maximum number of nodes of the result, `others` included.
+        others (Any): The node standing for the merged nodes.
 
-    # Add nodes and edges based on the cluster information
-        # Add nodes and edges based on the cluster information
+    Returns:
+        nx.Graph: `G` itself if it is small enough, otherwise the pruned copy.
+    """
+    if G.number_of_nodes() <= max_nodes:
+        return G
+    degrees = dict(G.degree())
+    top = set(heapq.nlargest(max_nodes - 1, degrees, key=degrees.get))
+    pruned = G.subgraph(top).copy()
+    pruned.add_edges_from((u if u in top else v, others) for u, v in G.edges() if (u in top) != (v in top))
+    logger.info("Drawing the %d most connected of %d cluster nodes", max_nodes - 1, G.number_of_nodes())
+    return pruned
+
+def _layout(G: "nx.Graph") -> Dict[Any, Any]:
+    """
+    Compute node positions for drawing a graph, reusing the positions of an identical graph.
+
+    Uses Graphviz's sfdp force-directed layout when pygraphviz is installed, and a
+    shortened, seeded spring layout otherwise.
+
+    Args:
+        G (nx.Graph): The graph to lay out.
+
+    Returns:
+        Dict[Any, Any]: Position of each node.
+    """
+    import networkx as nx
+    key = (frozenset(G.nodes()), frozenset(map(frozenset, G.edges())))
+    pos = _layout_cache.get(key)
+    if pos is None:
+        try:
+            pos = nx.nx_agraph.graphviz_layout(G, prog='sfdp')
+        except ImportError:
+            pos = nx.spring_layout(G, k=0.3, iterations=20, seed=0)
+        _layout_cache[key] = pos
+    return pos
+
+def _iter_traced_transactions(flows: List[TraceNode]) -> Iterator[TraceNode]:
+    """
+    Walk flow trees depth-first, yielding every traced transaction (parents before their spending transactions).
+
+    Args:
+        flows (List[TraceNode]): Flow trees, as built by `trace_transaction`.
+
+    Yields:
+        TraceNode: A transaction of the flows.
+    """
+    stack = list(reversed(flows))
+    while stack:
+        tx = stack.pop()
+        yield tx
+        stack.extend(output for output in reversed(tx.outputs) if isinstance(output, TraceNode))
+
+def visualize_cluster(cluster_report: Dict[str, Any], save_path: Optional[str] = None, show: bool = True,
+                      max_nodes: int = MAX_CLUSTER_NODES) -> None:
+    """
+    Visualize the cluster of Bitcoin addresses.
+
+    At most `max_nodes` nodes are drawn, so the layout stays tractable for large clusters:
+    the highest-degree nodes, with the remaining ones merged into a single "…others" node.
+
+    Args:
+        cluster_report (Dict[str, Any]): The report containing the cluster information, with the traced "transactions_flow" of each address.
+        save_path (Optional[str]): File to save the figure to, if any.
+        show (bool): Whether to display the figure; when False it is rendered off-screen with Agg.
+        max_nodes (int): Maximum number of nodes drawn.
+    """
+    # Collect nodes and edges based on the cluster information, then add them in bulk.
+    # Nodes are interned integer IDs; addresses and txids are only looked up for the labels.
+    interner = Interner()
+    node_id = interner.id
+    addresses = []
+    edges = []
     for address_info in cluster_report.get("addresses", []):
         address = address_info.get("address")
-        if address:
-            G.add_node(address)
-            transactions_flow = address_info.get("transactions_flow", [])
-            for flow in transactions_flow:
-                for tx in flow:
-                    if isinstance(tx, dict):
-                        txid = tx.get("txid")
-                        if txid:
-                            G.add_node(txid)
-                            G.add_edge(address, txid)
-                            for output in tx.get("outputs", []):
-                                output_address = output.get("address")
-                                if output_address:
-                                    G.add_node(output_address)
-                                    G.add_edge(txid, output_address)
+        if not address:
+            continue
+        address_id = node_id(address)
+        addresses.append(address_id)
+        # Each flow is a tree of TraceNodes whose spent outputs are the spending transactions' nodes
+        stack = list(address_info.get("transactions_flow", []))
+        edges.extend((address_id, node_id(tx.txid)) for tx in stack)
+        while stack:
+            tx = stack.pop()
+            tx_id = node_id(tx.txid)
+            for output in tx.outputs:
+                if isinstance(output, TraceNode):
+                    edges.append((tx_id, node_id(output.txid)))
+                    stack.append(output)
+                elif output.address:
+                    edges.append((tx_id, node_id(output.address)))
+
+    import networkx as nx
+    G = nx.Graph()
+    G.add_nodes_from(addresses)
+    G.add_edges_from(edges)
+    G = _prune_graph(G, max_nodes, others=node_id(OTHERS_NODE))
 
     # Draw the graph
-    plt.figure(figsize=(12, 12))
-    pos = nx.spring_layout(G, k=0.3)
-    nx.draw(G, pos, with_labels=True, node_size=500, node_color="skyblue", font_size=8, font_weight="bold", edge_color="gray")
-    plt.title("Bitcoin Address Cluster")
-    plt.show()
+    fig = _new_figure((12, 12), show)
+    ax = fig.add_subplot()
+    pos = _layout(G)
+    labels = {i: interner.i2s[i][:8] for i in G.nodes()}
+    # nx.draw and nx.draw_networkx end with plt.draw_if_interactive(), which resolves pyplot's backend;
+    # drawing the parts onto the axes directly keeps off-screen figures away from it
+    nx.draw_networkx_nodes(G, pos, ax=ax, node_size=500, node_color="skyblue")
+    nx.draw_networkx_edges(G, pos, ax=ax, node_size=500, edge_color="gray")
+    nx.draw_networkx_labels(G, pos, ax=ax, labels=labels, font_size=8, font_weight="bold")
+    ax.set_axis_off()
+    ax.set_title("Bitcoin Address Cluster")
+    _finish_figure(fig, save_path, show)
 
 
-def plot_balance_over_time(address_info: Dict[str, Any]) -> None:
+def plot_balance_over_time(address_info: Dict[str, Any], save_path: Optional[str] = None, show: bool = True) -> None:
     """
     Plot the balance of a Bitcoin address over time.
 
     Args:
-        address_info (Dict[str, Any]): The address information containing transaction history.
+        address_info (Dict[str, Any]): The address information, with the traced "transactions_flow" of the address.
+        save_path (Optional[str]): File to save the figure to, if any.
+        show (bool): Whether to display the figure; when False it is rendered off-screen with Agg.
     """
     if "address" not in address_info:
         logger.error("Address information is missing 'address' key")
         return
 
-    transactions = address_info.get("transactions_flow", [])
-    balance = 0
-    balance_history = []
-    timestamps = []
-
-    for tx in transactions:
-        tx_time = tx.get('time', 0)
-        for output in tx.get("outputs", []):
-            if output.get("address") == address_info["address"]:
-                balance += output.get("value", 0)
-        for input_tx in tx.get("inputs", []):
-            if input_tx.get("prevout", {}).get("scriptpubkey_address") == address_info["address"]:
-                balance -= input_tx.get("prevout", {}).get("value", 0)
-
-        balance_history.append(balance)
-        timestamps.append(pd.to_datetime(tx_time, unit='s'))
+    address = address_info["address"]
+    # A transaction reached from several traced flows counts once towards the balance
+    transactions = {tx.txid: tx for tx in _iter_traced_transactions(address_info.get("transactions_flow", []))}.values()
+    # One (block time, net balance change in BTC) row per transaction; the running balance is their
+    # cumulative sum. Unconfirmed transactions have no block time yet and are placed at the current time.
+    now = int(time.time())
+    deltas = [
+        (
+            tx.block_time if tx.block_time is not None else now,
+            sum(output.value for output in tx.outputs if isinstance(output, OutputRef) and output.address == address)
+            - sum(input_tx.get("prevout", {}).get("value", 0) for input_tx in tx.inputs
+                  if input_tx.get("prevout", {}).get("scriptpubkey_address") == address) / 1e8,
+        )
+        for tx in transactions
+    ]
+    import pandas as pd
+    df = pd.DataFrame(deltas, columns=['time', 'delta']).sort_values('time', kind='stable')
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    df['balance'] = df['delta'].cumsum()
 
-    plt.figure(figsize=(10, 5))
-    plt.plot(timestamps, balance_history, label='Balance over time')
-    plt.xlabel('Time')
-    plt.ylabel('Balance (BTC)')
-    plt.title(f"Balance over time for {address_info['address']}")
-    plt.legend()
-    plt.show()
+    fig = _new_figure((10, 5), show)
+    ax = fig.add_subplot()
+    ax.plot(df['time'], df['balance'], label='Balance over time')
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Balance (BTC)')
+    ax.set_title(f"Balance over time for {address}")
+    ax.legend()
+    _finish_figure(fig, save_path, show)
 
 
-def plot_transaction_values(transactions: List[Dict[str, Any]]) -> None:
+def plot_transaction_values(transactions: List[TraceNode], save_path: Optional[str] = None,
+                            show: bool = True) -> None:
     """
     Plot a histogram of transaction values.
 
     Args:
-        transactions (List[Dict[str, Any]]): List of transactions.
+        transactions (List[TraceNode]): Traced transaction flows; outputs of nested spending transactions are included.
+        save_path (Optional[str]): File to save the figure to, if any.
+        show (bool): Whether to display the figure; when False it is rendered off-screen with Agg.
     """
-    values = []
-    for tx in transactions:
-        for output in tx.get("outputs", []):
-            values.append(output.get("value", 0))
+    values = np.fromiter((output.value for tx in _iter_traced_transactions(transactions) for output in tx.outputs
+                          if isinstance(output, OutputRef)), dtype=np.float64)
+    # Zero-value outputs (e.g. OP_RETURN) carry no value to plot
+    values = values[values > 0]
 
-    plt.figure(figsize=(10, 5))
-    plt.hist(values, bins=50, log=True)
-    plt.xlabel('Transaction Value (BTC)')
-    plt.ylabel('Frequency')
-    plt.title('Histogram of Transaction Values')
-    plt.show()
+    fig = _new_figure((10, 5), show)
+    ax = fig.add_subplot()
+    ax.hist(values, bins=50, log=True)
+    ax.set_xlabel('Transaction Value (BTC)')
+    ax.set_ylabel('Frequency')
+    ax.set_title('Histogram of Transaction Values')
+    _finish_figure(fig, save_path, show)
 
 
-def plot_degree_distribution(G: nx.Graph) -> None:
+def plot_degree_distribution(G: "nx.Graph", save_path: Optional[str] = None, show: bool = True) -> None:
     """
     Plot the degree distribution of the graph.
 
     Args:
         G (nx.Graph): The graph to plot the degree distribution for.
+        save_path (Optional[str]): File to save the figure to, if any.
+        show (bool): Whether to display the figure; when False it is rendered off-screen with Agg.
     """
-    degrees = [G.degree(n) for n in G.nodes()]
-    plt.figure(figsize=(10, 5))
-    plt.hist(degrees, bins=50, log=True)
-    plt.xlabel('Degree')
-    plt.ylabel('Frequency')
-    plt.title('Degree Distribution')
-    plt.show()
+    # Iterate the degree view once into a typed array for the histogram
+    degrees = np.fromiter((d for _, d in G.degree()), dtype=np.int32, count=G.number_of_nodes())
+    fig = _new_figure((10, 5), show)
+    ax = fig.add_subplot()
+    ax.hist(degrees, bins=50, log=True)
+    ax.set_xlabel('Degree')
+    ax.set_ylabel('Frequency')
+    ax.set_title('Degree Distribution')
+    _finish_figure(fig, save_path, show)